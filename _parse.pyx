@@ -0,0 +1,33 @@
+# cython: language_level=3
+"""
+Optional compiled episode-number parser for very large libraries.
+
+A hand-written scan over the raw bytes of the filename — no regex
+engine, no per-character Python objects. rename_tool imports this when
+a compiled build is present and otherwise falls back to its pure-Python
+equivalent, so building it is entirely optional:
+
+    pip install cython
+    cythonize -i _parse.pyx
+"""
+
+def fast_sxxexx(str fname):
+    """Return the Exx episode digits of an SxxExx filename, or None."""
+    cdef bytes data
+    try:
+        data = fname.encode('ascii')
+    except UnicodeEncodeError:
+        # Non-ASCII names go through the Python fallback path
+        return None
+    cdef const unsigned char* s = data
+    cdef Py_ssize_t n = len(data)
+    cdef Py_ssize_t i
+    cdef unsigned char c
+    for i in range(n - 5):
+        c = s[i]
+        if (c == b'S' or c == b's') \
+                and b'0' <= s[i + 1] <= b'9' and b'0' <= s[i + 2] <= b'9' \
+                and (s[i + 3] == b'E' or s[i + 3] == b'e') \
+                and b'0' <= s[i + 4] <= b'9' and b'0' <= s[i + 5] <= b'9':
+            return data[i + 4:i + 6].decode('ascii')
+    return None
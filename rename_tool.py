@@ -1,4 +1,8 @@
 import os, re, stat, logging
+import shlex
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from dotenv import load_dotenv
 import signal
@@ -21,9 +25,12 @@ MOUNT_POINT = Path(os.environ['MOUNT_POINT'])
 # Create the local mount directory if it does not exist
 os.makedirs(MOUNT_POINT, exist_ok=True)
 
-# Mount the remote series directory via sshfs
-# Command: sshfs -p $REMOTE_PORT $REMOTE_USER@$REMOTE_HOST:$REMOTE_SERIES_PATH $MOUNT_POINT
-# Note: Ensure sshfs is installed and SSH key or password auth is set up.
+# Mount options tuned for the readdir/stat/rename storm this tool
+# generates: kernel + attribute caching, auto-reconnect, a fast cipher
+# and multiple SFTP connections so rename round-trips overlap
+SSHFS_OPTS = ('cache=yes,cache_timeout=115,kernel_cache,compression=no,'
+              'reconnect,ServerAliveInterval=15,max_conns=4,'
+              'Ciphers=aes128-gcm@openssh.com,big_writes')
 
 # ─────────────────────────────────────────────
 # CONFIGURATION
@@ -34,6 +41,10 @@ BASE_DIR = MOUNT_POINT
 # Set to True to skip confirmation prompts and auto-run
 AUTO_RUN = os.environ.get('AUTO_RUN', 'False').lower() in ('1','true','yes')
 
+# Set to True to ship all renames to the remote host in one ssh call
+# instead of issuing them one by one through the SSHFS mount
+REMOTE_BATCH = os.environ.get('REMOTE_BATCH', 'False').lower() in ('1','true','yes')
+
 # Configure logger
 logging.basicConfig(
     level=logging.INFO,
@@ -42,105 +53,249 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# ─────────────────────────────────────────────
+# Precompiled patterns (compiled once at import, not per file)
+# ─────────────────────────────────────────────
+_SEASON_RE = re.compile(r'^(?:season[\s_]?|s)(\d{1,2})', re.IGNORECASE)
+# Single alternation covering SxxExx, NxN and Exx naming schemes so the
+# filename is scanned once instead of up to three times
+_EP_RE = re.compile(r'[sS]\d{2}[eE](?P<a>\d{2})|(?:\d{1,2})[xX](?P<b>\d{2})|[eE](?P<c>\d{2})')
+# Heuristic markers for files that don't belong to the series (release
+# junk, readmes, shortcuts), matched in a single pass per filename
+_OUTLIER_RE = re.compile(r'PSArips\.com|\.url|\.txt|RARBG|ReadMe', re.IGNORECASE)
+
+# ─────────────────────────────────────────────
+# Mount the remote series directory via sshfs
+# ─────────────────────────────────────────────
+def _ensure_mounted():
+    """Mount REMOTE_SERIES_PATH on MOUNT_POINT if it isn't already."""
+    if os.path.ismount(MOUNT_POINT):
+        logger.debug("Mount point %s already mounted", MOUNT_POINT)
+        return
+    logger.info("Mounting %s:%s on %s", REMOTE_HOST, REMOTE_SERIES_PATH, MOUNT_POINT)
+    # Note: Ensure sshfs is installed and SSH key or password auth is set up.
+    subprocess.check_call([
+        'sshfs', '-p', str(REMOTE_PORT),
+        f'{REMOTE_USER}@{REMOTE_HOST}:{REMOTE_SERIES_PATH}',
+        str(MOUNT_POINT),
+        '-o', SSHFS_OPTS,
+    ])
+
 # ─────────────────────────────────────────────
 # Helpers
 # ─────────────────────────────────────────────
 def pad(n):
     return f"{int(n):02}"
 
+def _fast_sxxexx(fname):
+    """
+    Literal fast path for the common SxxExx scheme: a handful of C-level
+    str ops instead of a full regex search. Returns the episode number
+    as a string, or None to fall back to _EP_RE.
+    """
+    up = fname.upper()
+    idx = up.find('S')
+    while idx >= 0:
+        if up[idx + 1:idx + 3].isdigit() and up[idx + 3:idx + 4] == 'E' \
+                and up[idx + 4:idx + 6].isdigit():
+            return up[idx + 4:idx + 6]
+        idx = up.find('S', idx + 1)
+    return None
+
+# Optional compiled parser for very large libraries (tens of thousands
+# of files): build with `cythonize -i _parse.pyx` and this import swaps
+# in the C state machine; otherwise the pure-Python path above is used
+try:
+    from _parse import fast_sxxexx as _fast_sxxexx  # noqa: F811
+except ImportError:
+    pass
+
 # ─────────────────────────────────────────────
 # Gather all rename operations
 # ─────────────────────────────────────────────
-def gather_operations():
-    ops = []  # list of (old_path: Path, new_path: Path)
-    logger.info(f"Starting operation gathering in {BASE_DIR}")
-
-    try:
-        for season_dir in BASE_DIR.iterdir():
-            if not season_dir.is_dir():
-                continue
+def _scan_season(season_entry):
+    """
+    Plan renames for one season directory.
 
-            logger.debug(f"Processing directory: {season_dir.name}")
-            m_season = re.search(r'(?:season[\s_]?|s)(\d{1,2})', season_dir.name, re.IGNORECASE)
-            if not m_season:
-                logger.warning(f"Skipping unknown folder: {season_dir.name}")
+    Returns (ops, fnames) where fnames is every regular-file name seen,
+    so later stages can reuse the listing instead of re-reading the
+    directory over SSHFS.
+    """
+    ops = []
+    fnames = []
+    name = season_entry.name
+    logger.debug("Processing directory: %s", name)
+    # Cheap literal pre-check: every accepted scheme starts with
+    # 's'/'S', so skip the regex engine entirely on other folders
+    if name[:1].lower() != 's':
+        logger.warning("Skipping unknown folder: %s", name)
+        return ops, fnames
+    m_season = _SEASON_RE.search(name)
+    if not m_season:
+        logger.warning("Skipping unknown folder: %s", name)
+        return ops, fnames
+
+    season = pad(m_season.group(1))
+    title_prefix = f"How I Met Your Mother S{season}"
+    new_season_dir = BASE_DIR / title_prefix
+
+    # Plan episode renames inside the original folder first
+    with os.scandir(season_entry.path) as episodes:
+        for ep_entry in episodes:
+            if not ep_entry.is_file(follow_symlinks=False):
                 continue
+            try:
+                fname = ep_entry.name
+                fnames.append(fname)
+                logger.debug("Examining file: %s", fname)
+                ep_no = _fast_sxxexx(fname)
+                if ep_no is None:
+                    m_ep = _EP_RE.search(fname)
+                    if not m_ep:
+                        logger.warning("Skipping file, no episode found: %s", fname)
+                        continue
+                    ep_no = m_ep.group('a') or m_ep.group('b') or m_ep.group('c')
+                ep_no = pad(ep_no)
+                ext = os.path.splitext(fname)[1]
+                new_ep_name = title_prefix + f"E{ep_no}" + ext
+                new_ep_path = new_season_dir / new_ep_name
+                ep = Path(ep_entry.path)
+                if ep != new_ep_path:
+                    ops.append((ep, new_ep_path))
+                    logger.info("Planned rename: %s/%s -> %s/%s", name, fname, title_prefix, new_ep_name)
+            except Exception as e:
+                logger.error("Error processing file %s: %s", ep_entry.path, e)
+
+    # Plan folder rename if needed after episode ops
+    season_dir = Path(season_entry.path)
+    if season_dir != new_season_dir:
+        ops.append((season_dir, new_season_dir))
+        logger.info("Planned folder rename: %s -> %s", season_dir.name, new_season_dir.name)
+    return ops, fnames
 
-            season = pad(m_season.group(1))
-            new_season_dir = BASE_DIR / f"How I Met Your Mother S{season}"
+def gather_operations():
+    ops = []  # list of (old_path: Path, new_path: Path)
+    files_by_dir = {}  # directory path -> file names seen during the scan
+    logger.info("Starting operation gathering in %s", BASE_DIR)
 
-            # Plan episode renames inside the original folder first
-            for ep in season_dir.iterdir():
-                if not ep.is_file():
-                    continue
-                try:
-                    fname = ep.name
-                    logger.debug(f"Examining file: {fname}")
-                    m_ep = re.search(r'[sS]\d{2}[eE](\d{2})', fname)
-                    if m_ep:
-                        ep_no = m_ep.group(1)
-                    else:
-                        m2 = re.search(r'(\d{1,2})[xX](\d{2})', fname)
-                        if m2:
-                            ep_no = m2.group(2)
-                        else:
-                            m3 = re.search(r'[eE](\d{2})', fname)
-                            if m3:
-                                ep_no = m3.group(1)
-                            else:
-                                logger.warning(f"Skipping file, no episode found: {fname}")
-                                continue
-                    ep_no = pad(ep_no)
-                    ext = ep.suffix
-                    new_ep_name = f"How I Met Your Mother S{season}E{ep_no}{ext}"
-                    new_ep_path = new_season_dir / new_ep_name
-                    if ep != new_ep_path:
-                        ops.append((ep, new_ep_path))
-                        logger.info(f"Planned rename: {ep.relative_to(BASE_DIR)} -> {new_ep_path.relative_to(BASE_DIR)}")
-                except Exception as e:
-                    logger.error(f"Error processing file {ep}: {e}")
-
-            # Plan folder rename if needed after episode ops
-            if season_dir != new_season_dir:
-                ops.append((season_dir, new_season_dir))
-                logger.info(f"Planned folder rename: {season_dir.name} -> {new_season_dir.name}")
+    try:
+        # os.scandir reuses the type info from the readdir batch, so the
+        # is_dir/is_file checks below cost no extra stat() over SSHFS
+        with os.scandir(BASE_DIR) as seasons:
+            season_entries = [e for e in seasons if e.is_dir(follow_symlinks=False)]
+
+        # Seasons are independent and the scan is I/O-bound on SSHFS
+        # round-trips, so overlap them with a small thread pool
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            for entry, (season_ops, fnames) in zip(
+                    season_entries, pool.map(_scan_season, season_entries)):
+                ops.extend(season_ops)
+                files_by_dir[entry.path] = fnames
 
     except Exception as e:
-        logger.error(f"Failed gathering operations: {e}")
-    logger.info(f"Gathering complete: {len(ops)} operations planned")
-    return ops
+        logger.error("Failed gathering operations: %s", e)
+    logger.info("Gathering complete: %d operations planned", len(ops))
+    return ops, files_by_dir
 
 # ─────────────────────────────────────────────
 # Preview planned operations
 # ─────────────────────────────────────────────
 def preview(ops):
     logger.info("Previewing planned operations:")
-    print("\nPlanned renames:\n")
-    for old, new in ops:
-        print(f"  {old.relative_to(BASE_DIR)}  →  {new.relative_to(BASE_DIR)}")
-    print(f"\nTotal operations: {len(ops)}\n")
-
-# ─────────────────────────────────────────────
-# Prompt for confirmation
-# ─────────────────────────────────────────────
-def confirm(prompt="Proceed? [y/N]: "):
-    resp = input(prompt).strip().lower()
-    return resp in ('y', 'yes')
+    # One buffered write instead of a print (and stdout lock/flush) per op
+    body = "\n".join(
+        f"  {old.relative_to(BASE_DIR)}  →  {new.relative_to(BASE_DIR)}"
+        for old, new in ops
+    )
+    sys.stdout.write(f"\nPlanned renames:\n\n{body}\n\nTotal operations: {len(ops)}\n\n")
 
 # ─────────────────────────────────────────────
 # Apply renames (files first, then directories)
 # ─────────────────────────────────────────────
 def apply_ops(ops):
-    ops_sorted = sorted(ops, key=lambda pair: pair[0].as_posix().count(os.sep), reverse=True)
+    # len(parts) is O(1) after Path caches the tuple, unlike rebuilding
+    # and rescanning the posix string per comparison
+    ops_sorted = sorted(ops, key=lambda pair: -len(pair[0].parts))
     executed = []
+    # Seed the known-directory cache from a single readdir so mkdir only
+    # runs for directories that genuinely don't exist yet
+    try:
+        with os.scandir(BASE_DIR) as it:
+            existing_dirs = {e.path for e in it if e.is_dir(follow_symlinks=False)}
+    except OSError as e:
+        logger.error("Failed to list %s: %s", BASE_DIR, e)
+        existing_dirs = set()
     for old, new in ops_sorted:
         try:
-            new.parent.mkdir(parents=True, exist_ok=True)
-            os.rename(old, new)
+            parent = new.parent
+            if str(parent) not in existing_dirs:
+                parent.mkdir(parents=True, exist_ok=True)
+                existing_dirs.add(str(parent))
+            os.replace(old, new)
             executed.append((old, new))
-            logger.info(f"Renamed: {old.relative_to(BASE_DIR)} -> {new.relative_to(BASE_DIR)}")
+            logger.info("Renamed: %s -> %s", old.name, new.name)
         except Exception as e:
-            logger.error(f"Failed to rename {old} -> {new}: {e}")
+            logger.error("Failed to rename %s -> %s: %s", old, new, e)
+    logger.info("Renaming complete")
+    return executed
+
+# ─────────────────────────────────────────────
+# Apply renames remotely in one ssh round-trip
+# ─────────────────────────────────────────────
+def _to_remote(path):
+    """Translate a path under MOUNT_POINT to its remote equivalent."""
+    return f"{REMOTE_SERIES_PATH}/{path.relative_to(MOUNT_POINT).as_posix()}"
+
+def apply_ops_remote(ops):
+    """
+    Execute all renames as a single `bash -s` script on the remote host,
+    amortizing N per-file SFTP round-trips into one ssh connection.
+
+    Each mv fails independently, mirroring apply_ops' per-op try/except:
+    failed ops are reported on stdout as "FAIL <index>" and only the ops
+    that actually succeeded are returned, so main()'s rollback prompt
+    covers exactly what was renamed.
+    """
+    # len(parts) is O(1) after Path caches the tuple, unlike rebuilding
+    # and rescanning the posix string per comparison
+    ops_sorted = sorted(ops, key=lambda pair: -len(pair[0].parts))
+    lines = []
+    for i, (old, new) in enumerate(ops_sorted):
+        remote_old = _to_remote(old)
+        remote_new = _to_remote(new)
+        parent = remote_new.rsplit('/', 1)[0]
+        lines.append(f"mkdir -p -- {shlex.quote(parent)}")
+        lines.append(f"mv -T -- {shlex.quote(remote_old)} {shlex.quote(remote_new)} || echo \"FAIL {i}\"")
+    script = "\n".join(lines) + "\n"
+    logger.info("Executing %d renames remotely on %s", len(ops_sorted), REMOTE_HOST)
+    try:
+        result = subprocess.run(
+            ['ssh', '-p', str(REMOTE_PORT), f'{REMOTE_USER}@{REMOTE_HOST}', 'bash', '-s'],
+            input=script.encode(),
+            stdout=subprocess.PIPE,
+        )
+    except OSError as e:
+        logger.error("Remote batch rename failed: %s", e)
+        return []
+    if result.returncode != 0:
+        # ssh/bash itself failed (connection refused, auth, ...); the
+        # script's own mv failures never bubble up as a nonzero exit
+        logger.error("Remote batch rename failed with exit code %d", result.returncode)
+        return []
+    failed = set()
+    for line in result.stdout.decode().splitlines():
+        if line.startswith("FAIL "):
+            try:
+                failed.add(int(line[5:]))
+            except ValueError:
+                pass
+    executed = []
+    for i, (old, new) in enumerate(ops_sorted):
+        if i in failed:
+            logger.error("Failed to rename %s -> %s", old, new)
+        else:
+            executed.append((old, new))
+            logger.info("Renamed: %s -> %s", old.name, new.name)
     logger.info("Renaming complete")
     return executed
 
@@ -153,39 +308,42 @@ def rollback(executed):
         try:
             if new.exists():
                 os.rename(new, old)
-                logger.info(f"Rolled back: {new.relative_to(BASE_DIR)} -> {old.relative_to(BASE_DIR)}")
+                logger.info("Rolled back: %s -> %s", new.name, old.name)
         except Exception as e:
-            logger.error(f"Failed to rollback {new} -> {old}: {e}")
+            logger.error("Failed to rollback %s -> %s: %s", new, old, e)
     logger.warning("Rollback complete")
 
 # ─────────────────────────────────────────────
 # Checks for inconsistent files
 # ─────────────────────────────────────────────
-def check_outliers(ops):
+def check_outliers(ops, files_by_dir):
     """
     Detect files in the target directory that don’t match the rename operations
     (e.g. contain PSArips.com.txt, .url, etc.), and prompt to keep or delete them.
+
+    `files_by_dir` is the listing cached by gather_operations, so no second
+    readdir round-trip is needed over SSHFS.
     """
     if not ops:
         logger.info("No operations to determine target directory for outlier check.")
         return
 
-    # All ops target the same folder
-    directory = os.path.dirname(ops[0].src)
-    try:
-        all_files = os.listdir(directory)
-    except OSError as e:
-        logger.error(f"[Outliers] Failed to list directory '{directory}': {e}")
-        return
+    # All ops target the same folder (ops are (old, new) tuples)
+    directory = os.path.dirname(ops[0][0])
+    all_files = files_by_dir.get(str(directory))
+    if all_files is None:
+        try:
+            all_files = os.listdir(directory)
+        except OSError as e:
+            logger.error(f"[Outliers] Failed to list directory '{directory}': {e}")
+            return
 
     # Files involved in renaming
-    renamed = {os.path.basename(op.src) for op in ops}
+    renamed = {os.path.basename(old) for old, _new in ops}
 
-    # Heuristic keywords for likely outliers
-    keywords = ["PSArips.com", ".url", ".txt", "RARBG", "ReadMe"]
     outliers = [
         f for f in all_files
-        if f not in renamed and any(kw in f for kw in keywords)
+        if f not in renamed and _OUTLIER_RE.search(f)
     ]
 
     if not outliers:
@@ -261,12 +419,18 @@ def confirm(prompt="Proceed? [y/N]: ", timeout=15):
 # Main routine
 # ─────────────────────────────────────────────
 def main():
-    ops = gather_operations()
+    try:
+        _ensure_mounted()
+    except (OSError, subprocess.CalledProcessError) as e:
+        logger.error(f"[Main] Failed to mount {MOUNT_POINT}: {e}")
+        return
+
+    ops, files_by_dir = gather_operations()
     if not ops:
         logger.info("Nothing to rename.")
         return
 
-    check_outliers(ops)
+    check_outliers(ops, files_by_dir)
 
     preview(ops)
     if not confirm("Apply rename operations? [y/N]: "):
@@ -274,7 +438,7 @@ def main():
         return
 
     try:
-        executed = apply_ops(ops)
+        executed = apply_ops_remote(ops) if REMOTE_BATCH else apply_ops(ops)
     except Exception as e:
         logger.error(f"[Main] Fatal error during rename operations: {e}")
         return